@@ -0,0 +1,55 @@
+"""
+浏览器内存基准测试 - 对比标准模式与低内存模式下每 GB 内存能容纳的账号数
+用法：python bench_memory.py [上下文数量]
+"""
+import os
+import sys
+import asyncio
+from playwright.async_api import async_playwright
+
+from main import (
+    BASE_URL, HEADLESS, browser_launch_args, browser_rss_mb, new_account_context,
+)
+
+BENCH_URL = os.environ.get("BENCH_URL", f"{BASE_URL}/user/login")
+
+
+async def measure(p, low_memory: bool, contexts: int) -> float:
+    """打开指定数量的上下文并加载页面，返回单个上下文的平均内存（MB）"""
+    browser = await p.chromium.launch(headless=HEADLESS, args=browser_launch_args(low_memory))
+    try:
+        baseline = browser_rss_mb()
+        opened = []
+        for _ in range(contexts):
+            context = await new_account_context(browser, low_memory)
+            page = await context.new_page()
+            await page.goto(BENCH_URL, wait_until='networkidle')
+            opened.append(context)
+        await asyncio.sleep(1)
+        total = browser_rss_mb()
+        for context in opened:
+            await context.close()
+        return (total - baseline) / contexts
+    finally:
+        await browser.close()
+
+
+async def main():
+    contexts = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    print(f"[基准] 页面: {BENCH_URL}，上下文数量: {contexts}")
+
+    async with async_playwright() as p:
+        before = await measure(p, False, contexts)
+        after = await measure(p, True, contexts)
+
+    if before <= 0 or after <= 0:
+        print("[基准] 无法读取浏览器内存（需要 Linux /proc）")
+        return
+
+    print(f"[基准] 标准模式: 单上下文 {before:.0f}MB，约 {1024 / before:.1f} 账号/GB")
+    print(f"[基准] 低内存模式: 单上下文 {after:.0f}MB，约 {1024 / after:.1f} 账号/GB")
+    print(f"[基准] 提升: {before / after:.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
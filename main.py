@@ -6,11 +6,21 @@ import os
 import sys
 import asyncio
 import random
-import requests
+import httpx
 import base64
 import io
+import re
+import json
+import time
+import heapq
+import csv
+import itertools
+import math
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
-from playwright.async_api import async_playwright
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 from PIL import Image
 import pytz
 
@@ -21,6 +31,8 @@ if sys.platform == 'win32':
 
 # 滑块缺口识别 API
 SLIDER_API_URL = "https://byye.pythonanywhere.com"
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))  # 图片压缩线程数
+LOOP_LAG_THRESHOLD_MS = float(os.environ.get("LOOP_LAG_THRESHOLD_MS", "200"))  # 事件循环卡顿告警阈值（毫秒）
 
 # ✅ 配置区 - 建议使用环境变量
 USERNAME = os.environ.get("ZHUIMI_USERNAME", "")
@@ -28,15 +40,881 @@ PASSWORD = os.environ.get("ZHUIMI_PASSWORD", "")
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID", "")
 
+# 多账号：每行一个 "用户名:密码"，未配置时使用 ZHUIMI_USERNAME / ZHUIMI_PASSWORD
+ACCOUNTS = os.environ.get("ZHUIMI_ACCOUNTS", "")
+# 账号文件：.jsonl（每行 {"username": ..., "password": ...}）或带 username,password 表头的 .csv，"-" 表示从标准输入读取 JSONL
+ACCOUNTS_FILE = os.environ.get("ZHUIMI_ACCOUNTS_FILE", "")
+
 BASE_URL = "https://zhuimi.xn--v4q818bf34b.com"
 HEADLESS = True  # 设为 False 可以看到浏览器操作过程
 
+# ✅ 调度配置 - 多账号时在时间窗口内分散签到，避免集中请求被限流
+# 账号按批读取（总数事先未知），窗口作用于每一批：一批账号在窗口内分散开始，这批全部开始后才读取下一批，
+# 总耗时约为 批数 × 窗口；账号很多时应相应调小窗口，避免超过任务时限
+SCHEDULE_BATCH_WINDOW = float(os.environ.get("SCHEDULE_BATCH_WINDOW_SECONDS", "0"))  # 每批账号的分散时间窗口（秒）
+SCHEDULE_JITTER = float(os.environ.get("SCHEDULE_JITTER_SECONDS", "5"))  # 每个账号的随机抖动上限（秒）
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "2"))  # 同时签到的账号数
+SCHEDULE_BATCH = int(os.environ.get("SCHEDULE_BATCH_SIZE", "50"))  # 每次从账号源读取的账号数，优先级只在批内排序
+SITE_RATE_PER_MIN = float(os.environ.get("SITE_RATE_PER_MIN", "30"))  # 访问 BASE_URL 的限速（次/分钟，0 为不限）
+SOLVER_RATE_PER_MIN = float(os.environ.get("SOLVER_RATE_PER_MIN", "10"))  # 调用识别 API 的限速（次/分钟，0 为不限）
+MAX_REQUEUE = int(os.environ.get("MAX_REQUEUE", "1"))  # 失败账号重新排队的次数（登录/签到阶段重试已用完的账号除外）
+REQUEUE_DELAY = float(os.environ.get("REQUEUE_DELAY_SECONDS", "30"))  # 重新排队前的等待时间（秒）
+RISK_DAYS = int(os.environ.get("RISK_DAYS", "3"))  # 剩余天数低于该值的账号优先签到
+
+# ✅ 低内存模式 - 小内存 runner 上尽量多地并行账号
+LOW_MEMORY = os.environ.get("LOW_MEMORY_MODE", "").lower() in ("1", "true", "yes")
+BROWSER_MEMORY_LIMIT_MB = int(os.environ.get("BROWSER_MEMORY_LIMIT_MB", "0"))  # 浏览器总内存上限，0 为物理内存的 60%
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+VIEWPORT = {'width': 1280, 'height': 800}
+LOW_MEMORY_VIEWPORT = {'width': 800, 'height': 600}
+
+# 低内存模式下的 Chromium 参数：关闭 GPU/合成加速和站点隔离带来的额外进程
+# Playwright 已自带 --disable-dev-shm-usage、--disable-extensions 等参数；不要传 --disable-features，
+# 同名参数以最后一个为准，会覆盖 Playwright 为请求拦截关闭的特性列表
+LOW_MEMORY_ARGS = [
+    '--disable-gpu',
+    '--disable-gpu-compositing',
+    '--disable-software-rasterizer',
+    '--disable-accelerated-2d-canvas',
+    '--disable-site-isolation-trials',
+    '--renderer-process-limit=4',
+    '--js-flags=--max-old-space-size=128',
+]
+
+# 低内存模式下不加载的资源类型（验证码图片是 data: URI，不受影响）
+LOW_MEMORY_BLOCKED_RESOURCES = ('image', 'media', 'font')
+
+# 图片压缩等 CPU 密集任务在线程池中执行，不阻塞事件循环
+IMAGE_POOL = ThreadPoolExecutor(max_workers=max(1, IMAGE_WORKERS), thread_name_prefix="image")
+
+# ✅ 自适应超时 - 超时 = 最近耗时的 p99 × (1 + 余量)，并限制在下限与上限之间
+LATENCY_WINDOW = int(os.environ.get("LATENCY_WINDOW", "200"))  # 每个阶段保留的最近耗时样本数
+TIMEOUT_MARGIN = float(os.environ.get("TIMEOUT_MARGIN", "0.5"))  # p99 之上的余量比例
+TIMEOUT_MIN_SAMPLES = int(os.environ.get("TIMEOUT_MIN_SAMPLES", "10"))  # 样本不足时使用默认超时
+
+# 各阶段/接口的超时：(默认, 下限, 上限)，单位秒；goto/reload/submit 按路径分别统计
+TIMEOUT_LIMITS = {
+    'slider': (5, 2, 15),  # 等待滑块验证码出现
+    'solver_api': (30, 5, 60),  # 缺口识别 API
+    'telegram': (10, 3, 30),  # Telegram 通知
+    'goto': (30, 10, 90),  # 页面跳转（等待 networkidle）
+    'reload': (30, 10, 90),  # 页面刷新
+    'submit': (30, 10, 90),  # 点击提交按钮（等待触发的导航）
+}
+
+# ✅ 阶段重试 - 失败时只重试该阶段，沿用已登录的上下文
+# 登录或签到阶段重试用完导致失败的账号不再由调度器重新排队；其余失败（如创建上下文异常、重试次数设为 0）仍按 MAX_REQUEUE 重新排队
+STAGE_RETRIES = {
+    'session': int(os.environ.get("RETRIES_SESSION", "2")),  # 登录
+    'dashboard': int(os.environ.get("RETRIES_DASHBOARD", "2")),  # 获取用户信息
+    'signin': int(os.environ.get("RETRIES_SIGNIN", "1")),  # 签到（每次阶段内部还有 3 次滑块尝试，注意识别 API 限速）
+    'stats': int(os.environ.get("RETRIES_STATS", "2")),  # 获取签到统计信息
+    'notify': int(os.environ.get("RETRIES_NOTIFY", "2")),  # 发送通知
+}
+FATAL_STAGES = {'session', 'signin'}  # 失败会导致整个账号失败的阶段
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY_SECONDS", "2"))  # 第一次重试前的退避时间（秒）
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY_SECONDS", "30"))  # 退避时间上限（秒）
+
+# 签到结果：成功、失败、超时
+OUTCOME_OK = 'ok'
+OUTCOME_FAILED = 'failed'
+OUTCOME_TIMEOUT = 'timeout'
+
+# ✅ 运行模式 - live：正常签到；record：录制 HAR 和验证码识别结果；replay：离线回放并对比各阶段耗时
+RUN_MODES = ('live', 'record', 'replay')
+RUN_MODE = os.environ.get("RUN_MODE", "live")
+HAR_DIR = os.environ.get("HAR_DIR", "har")  # 录制文件目录
+REPLAY_LATENCY_MS = float(os.environ.get("REPLAY_LATENCY_MS", "0"))  # 回放时为每个请求注入的延迟（毫秒）
+REPLAY_SEED = int(os.environ.get("REPLAY_SEED", "0"))  # 录制/回放时的随机数种子，保证滑动轨迹一致
+
+# 持久化状态目录（GitHub Actions 中通过 cache 在多次运行间保留）
+STATE_DIR = os.environ.get("ZHUIMI_STATE_DIR", ".zhuimi_state")
+ACCOUNT_STATE_FILE = os.path.join(STATE_DIR, "accounts.json")
+LATENCY_FILE = os.path.join(STATE_DIR, "latency.json")
+CHECKPOINT_PREFIX = "checkpoint-"  # 断点记录按北京时间日期分文件：checkpoint-YYYY-MM-DD.jsonl
+
+
+class TokenBucket:
+    """
+    异步令牌桶限速器
+    rate_per_min 为每分钟补充的令牌数，burst 为桶容量；rate_per_min <= 0 时不限速
+    """
+
+    def __init__(self, name: str, rate_per_min: float, burst: int = 2):
+        self.name = name
+        self.rate_per_min = rate_per_min
+        self.rate = rate_per_min / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+        self.acquired = 0
+        self.waited = 0.0
+        self.first_at = None
+        self.last_at = None
+
+    async def acquire(self):
+        """获取一个令牌，令牌不足时等待"""
+        async with self.lock:
+            now = time.monotonic()
+            if self.rate > 0:
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens < 1:
+                    wait = (1 - self.tokens) / self.rate
+                    await asyncio.sleep(wait)
+                    self.waited += wait
+                    now = time.monotonic()
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                self.tokens -= 1
+            self.acquired += 1
+            if self.first_at is None:
+                self.first_at = now
+            self.last_at = now
+
+    def disable(self):
+        """取消限速（回放模式下不访问真实服务）"""
+        self.rate_per_min = 0
+        self.rate = 0
+
+    def achieved_rate(self) -> float:
+        """实际请求速率（次/分钟）"""
+        if self.acquired < 2 or self.last_at <= self.first_at:
+            return 0.0
+        return (self.acquired - 1) / (self.last_at - self.first_at) * 60
+
+    def report(self) -> str:
+        limit = f"{self.rate_per_min:g}/min" if self.rate > 0 else "不限"
+        return (f"{self.name}: {self.acquired} 次，实际速率 {self.achieved_rate():.1f}/min"
+                f"（限速 {limit}，限速等待 {self.waited:.1f}s）")
+
+
+SITE_LIMITER = TokenBucket("站点请求", SITE_RATE_PER_MIN)
+SOLVER_LIMITER = TokenBucket("识别 API", SOLVER_RATE_PER_MIN, burst=1)
+
+
+def browser_launch_args(low_memory: bool = LOW_MEMORY) -> list:
+    """浏览器启动参数"""
+    args = ['--disable-blink-features=AutomationControlled']
+    if low_memory:
+        args += LOW_MEMORY_ARGS
+    return args
+
+
+async def new_account_context(browser, low_memory: bool = LOW_MEMORY, har_path: str = None):
+    """
+    创建账号使用的浏览器上下文
+    record 模式下把所有请求录制到 har_path，replay 模式下从 har_path 回放且不访问网络
+    """
+    options = {}
+    if RUN_MODE == 'record' and har_path:
+        os.makedirs(os.path.dirname(har_path) or '.', exist_ok=True)
+        options = {'record_har_path': har_path, 'record_har_content': 'embed'}
+
+    context = await browser.new_context(
+        viewport=LOW_MEMORY_VIEWPORT if low_memory else VIEWPORT,
+        user_agent=USER_AGENT,
+        **options
+    )
+
+    if RUN_MODE == 'replay' and har_path:
+        # 请求体与录制时不同的请求（登录表单、滑动轨迹）按方法和 URL 回放，仍找不到的直接中止，保证完全离线
+        await context.route("**/*", har_fallback_handler(har_path))
+        await context.route_from_har(har_path, not_found='fallback')
+
+    # 注入反检测脚本
+    await context.add_init_script('''
+        Object.defineProperty(navigator, 'webdriver', {
+            get: () => undefined
+        });
+    ''')
+
+    if low_memory:
+        async def block_heavy(route):
+            if route.request.resource_type in LOW_MEMORY_BLOCKED_RESOURCES:
+                await route.abort()
+            else:
+                await route.fallback()
+
+        await context.route("**/*", block_heavy)
+
+    if RUN_MODE == 'replay' and REPLAY_LATENCY_MS > 0:
+        async def inject_latency(route):
+            await asyncio.sleep(REPLAY_LATENCY_MS / 1000)
+            await route.fallback()
+
+        await context.route("**/*", inject_latency)
+
+    return context
+
+
+def har_fallback_handler(har_path: str):
+    """
+    回放时处理 HAR 中按请求体匹配不到的请求
+    按 (方法, URL) 依次返回录制的响应，用完后重复最后一条；没有录制过的请求直接中止
+    """
+    responses = {}
+    try:
+        with open(har_path, encoding='utf-8') as f:
+            entries = json.load(f).get('log', {}).get('entries', [])
+    except FileNotFoundError:
+        print(f"[回放] 未找到 HAR: {har_path}")
+        entries = []
+    for entry in entries:
+        request = entry.get('request', {})
+        responses.setdefault((request.get('method'), request.get('url')), []).append(entry.get('response', {}))
+
+    async def handler(route):
+        recorded = responses.get((route.request.method, route.request.url))
+        if not recorded:
+            await route.abort()
+            return
+        response = recorded.pop(0) if len(recorded) > 1 else recorded[0]
+        content = response.get('content', {})
+        body = content.get('text') or ''
+        body = base64.b64decode(body) if content.get('encoding') == 'base64' else body.encode('utf-8')
+        # 响应体已经解压，去掉与原始传输相关的头
+        headers = {h['name']: h['value'] for h in response.get('headers', [])
+                   if h['name'].lower() not in ('content-length', 'content-encoding', 'transfer-encoding')}
+        await route.fulfill(status=response.get('status', 200), headers=headers, body=body)
+
+    return handler
+
+
+async def next_stage_page(context, page):
+    """低内存模式下在阶段之间关闭旧页面并换用新页面，释放渲染进程内存"""
+    if not LOW_MEMORY:
+        return page
+    await page.close()
+    return await context.new_page()
+
+
+def read_rss_kb(pid: int) -> int:
+    """读取进程常驻内存（KB），非 Linux 或进程已退出时返回 0"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def browser_rss_mb() -> float:
+    """统计当前进程派生的所有 Chromium 进程的内存总和（MB）"""
+    if not os.path.isdir('/proc'):
+        return 0.0
+
+    children = {}
+    names = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                stat = f.read()
+            # 格式：pid (comm) state ppid ...
+            comm = stat[stat.index('(') + 1:stat.rindex(')')]
+            ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        except (OSError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+        names[int(entry)] = comm
+
+    total_kb = 0
+    stack = [os.getpid()]
+    while stack:
+        pid = stack.pop()
+        for child in children.get(pid, []):
+            stack.append(child)
+            name = names.get(child, '').lower()
+            if 'chrom' in name or 'headless' in name:
+                total_kb += read_rss_kb(child)
+    return total_kb / 1024
+
+
+def system_memory_mb() -> float:
+    """物理内存总量（MB），取不到返回 0"""
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemTotal:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+
+class MemoryMonitor:
+    """
+    浏览器内存监控
+    每个账号采样一次 Chromium 进程树的总内存，超过上限时降低并发，回落后逐步恢复
+    单上下文内存为估算值：(总内存 - 基线) / 活跃上下文数，并非逐个上下文测量
+    """
+
+    def __init__(self, enabled: bool = LOW_MEMORY, limit_mb: float = BROWSER_MEMORY_LIMIT_MB):
+        self.enabled = enabled
+        self.limit_mb = limit_mb or system_memory_mb() * 0.6
+        self.baseline_mb = 0.0
+        self.contexts = 0
+        self.max_concurrency = None
+        self.samples = []  # 每个上下文的内存估算（MB）
+        self.peak_mb = 0.0
+
+    def start(self, max_concurrency: int):
+        """浏览器启动后记录基线内存"""
+        self.max_concurrency = max_concurrency
+        if self.enabled:
+            self.baseline_mb = browser_rss_mb()
+            print(f"[内存] 浏览器基线内存: {self.baseline_mb:.0f}MB，上限: {self.limit_mb:.0f}MB")
+
+    def allowed(self, concurrency: int) -> int:
+        """当前允许的并发数"""
+        if not self.enabled or self.max_concurrency is None:
+            return concurrency
+        return min(concurrency, self.max_concurrency)
+
+    def sample(self, label: str = ""):
+        """采样一次内存，并根据内存压力调整并发"""
+        if not self.enabled:
+            return
+        total = browser_rss_mb()
+        self.peak_mb = max(self.peak_mb, total)
+        per_context = (total - self.baseline_mb) / max(1, self.contexts)
+        self.samples.append(per_context)
+        print(f"[内存] {label} 浏览器总内存 {total:.0f}MB，活跃上下文 {self.contexts}，单上下文约 {per_context:.0f}MB")
+
+        if not self.limit_mb or self.max_concurrency is None:
+            return
+        if total > self.limit_mb and self.max_concurrency > 1:
+            self.max_concurrency -= 1
+            print(f"[内存] ⚠️ 内存压力过高，并发降为 {self.max_concurrency}")
+        elif total < self.limit_mb * 0.6 and self.max_concurrency < MAX_CONCURRENCY:
+            self.max_concurrency += 1
+            print(f"[内存] 内存压力回落，并发恢复为 {self.max_concurrency}")
+
+    def report(self) -> str:
+        if not self.samples:
+            return "未采样"
+        avg = sum(self.samples) / len(self.samples)
+        per_gb = 1024 / avg if avg > 0 else 0
+        return (f"单上下文平均 {avg:.0f}MB（约 {per_gb:.1f} 账号/GB），"
+                f"峰值 {self.peak_mb:.0f}MB，最终并发 {self.max_concurrency}")
+
+
+MEMORY_MONITOR = MemoryMonitor()
+
+_http_client = None
+
+
+def http_client() -> httpx.AsyncClient:
+    """共享的异步 HTTP 客户端"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient()
+    return _http_client
+
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+class LoopLagMonitor:
+    """
+    事件循环卡顿监控
+    定时唤醒并比较实际唤醒时间与预期时间，超过阈值时记录并告警
+    """
+
+    def __init__(self, threshold_ms: float = LOOP_LAG_THRESHOLD_MS, interval: float = 0.1):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - expected
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                print(f"[事件循环] ⚠️ 卡顿 {lag * 1000:.0f}ms")
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def report(self) -> str:
+        return f"卡顿 {self.stalls} 次（阈值 {self.threshold * 1000:.0f}ms），最大延迟 {self.max_lag * 1000:.0f}ms"
+
+
+class TimeoutManager:
+    """
+    自适应超时管理
+    按阶段/接口记录最近的耗时（滚动窗口），由最近的 p99 加余量得出超时时间，
+    并持久化到状态目录，供下次运行使用
+    """
+
+    def __init__(self, path: str = LATENCY_FILE, window: int = LATENCY_WINDOW,
+                 margin: float = TIMEOUT_MARGIN, min_samples: int = TIMEOUT_MIN_SAMPLES):
+        self.path = path
+        self.window = max(1, window)
+        self.margin = margin
+        self.min_samples = min_samples
+        self.samples = {}  # 键 -> 最近耗时列表（秒）
+        self.timeouts = {}  # 键 -> 本次运行超时次数
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.samples = {key: values[-self.window:] for key, values in json.load(f).items()}
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[超时] 读取耗时记录失败: {e}")
+
+    def save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({key: [round(v, 3) for v in values] for key, values in self.samples.items()}, f)
+        except Exception as e:
+            print(f"[超时] 保存耗时记录失败: {e}")
+
+    @staticmethod
+    def _limits(key: str) -> tuple:
+        return TIMEOUT_LIMITS.get(key.split(':', 1)[0], TIMEOUT_LIMITS['goto'])
+
+    def record(self, key: str, seconds: float):
+        """记录一次耗时"""
+        values = self.samples.setdefault(key, [])
+        values.append(seconds)
+        del values[:-self.window]
+
+    def count_timeout(self, key: str):
+        """只统计一次超时，不计入耗时样本"""
+        self.timeouts[key] = self.timeouts.get(key, 0) + 1
+
+    def record_timeout(self, key: str, seconds: float):
+        """记录一次超时；按超时时间计入样本，使后续超时逐步放宽"""
+        self.count_timeout(key)
+        self.record(key, seconds)
+
+    def p99(self, key: str):
+        values = sorted(self.samples.get(key, []))
+        if len(values) < self.min_samples:
+            return None
+        return values[max(0, math.ceil(len(values) * 0.99) - 1)]
+
+    def timeout(self, key: str) -> float:
+        """当前超时时间（秒）"""
+        default, floor, ceiling = self._limits(key)
+        p99 = self.p99(key)
+        if p99 is None:
+            return default
+        return min(ceiling, max(floor, p99 * (1 + self.margin)))
 
-def send_telegram(message: str):
-    """发送 Telegram 通知"""
+    def timeout_ms(self, key: str) -> int:
+        return int(self.timeout(key) * 1000)
+
+    def report(self):
+        for key in sorted(set(self.samples) | set(self.timeouts)):
+            p99 = self.p99(key)
+            p99_text = f"{p99:.2f}s" if p99 is not None else "样本不足"
+            print(f"[超时] {key}: 样本 {len(self.samples.get(key, []))}，p99 {p99_text}，"
+                  f"超时 {self.timeout(key):.1f}s，本次超时 {self.timeouts.get(key, 0)} 次")
+
+
+TIMEOUTS = TimeoutManager()
+
+
+def safe_name(name: str) -> str:
+    """把用户名转换为可用作文件名的字符串"""
+    return re.sub(r'[^\w.-]', '_', name) or 'account'
+
+
+class CaptchaTape:
+    """
+    验证码识别 API 的录制/回放
+    record 模式下逐行保存每次请求的图片和 API 响应，replay 模式下按顺序返回录制的响应
+    """
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self.entries = []
+        if mode == 'replay':
+            try:
+                with open(path, encoding='utf-8') as f:
+                    self.entries = [json.loads(line) for line in f if line.strip()]
+            except FileNotFoundError:
+                print(f"[回放] 未找到验证码记录: {path}")
+        elif mode == 'record':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            open(path, 'w').close()
+
+    def record(self, bg: str, front: str, status_code: int, response, error: str = None):
+        """追加一条记录；请求超时或异常时 error 为 "timeout" 或异常信息，保证回放顺序不错位"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({"bg": bg, "front": front, "status": status_code, "response": response,
+                                "error": error}, ensure_ascii=False) + '\n')
+
+    def next(self) -> tuple:
+        """返回下一条录制的 (状态码, 响应, 错误)，没有记录时返回 (None, None, None)"""
+        if not self.entries:
+            return None, None, None
+        entry = self.entries.pop(0)
+        return entry.get('status'), entry.get('response'), entry.get('error')
+
+
+def _iter_account_lines(lines):
+    """解析 JSONL 账号行"""
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError:
+            print(f"[账号] 跳过无法解析的行: {line[:30]}")
+            continue
+        if item.get('username'):
+            yield {"username": str(item['username']), "password": str(item.get('password', ''))}
+
+
+def iter_accounts(path: str = ACCOUNTS_FILE):
+    """
+    逐个读取账号，不一次性载入全部账号
+    优先级：账号文件 / 标准输入 > ZHUIMI_ACCOUNTS > ZHUIMI_USERNAME / ZHUIMI_PASSWORD
+    """
+    if path == '-':
+        yield from _iter_account_lines(sys.stdin)
+        return
+
+    if path:
+        # utf-8-sig：兼容 Excel 保存的带 BOM 的文件
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            if path.lower().endswith('.csv'):
+                reader = csv.DictReader(f)
+                if 'username' not in (reader.fieldnames or []):
+                    print(f"[账号] ⚠️ {path} 的表头缺少 username 列: {reader.fieldnames}")
+                for row in reader:
+                    if row.get('username'):
+                        yield {"username": row['username'].strip(), "password": (row.get('password') or '').strip()}
+            else:
+                yield from _iter_account_lines(f)
+        return
+
+    found = False
+    for line in ACCOUNTS.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#') or ':' not in line:
+            continue
+        username, password = line.split(':', 1)
+        found = True
+        yield {"username": username.strip(), "password": password.strip()}
+
+    if not found and USERNAME:
+        yield {"username": USERNAME, "password": PASSWORD}
+
+
+class Checkpoint:
+    """
+    断点记录
+    每个账号得到最终结果后追加一行到当天的记录文件，重新运行时跳过当天已成功的账号
+    """
+
+    def __init__(self, state_dir: str = STATE_DIR):
+        beijing_tz = pytz.timezone('Asia/Shanghai')
+        self.date = datetime.now(beijing_tz).strftime("%Y-%m-%d")
+        self.path = os.path.join(state_dir, f"{CHECKPOINT_PREFIX}{self.date}.jsonl")
+        self.completed = set()
+        self.skipped = 0
+
+        os.makedirs(state_dir, exist_ok=True)
+        # 清理以前日期的记录
+        for name in os.listdir(state_dir):
+            if name.startswith(CHECKPOINT_PREFIX) and name != os.path.basename(self.path):
+                os.remove(os.path.join(state_dir, name))
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # 崩溃时可能留下写了一半的行
+                    if entry.get('status') == OUTCOME_OK:
+                        self.completed.add(entry['username'])
+        except FileNotFoundError:
+            pass
+
+        if self.completed:
+            print(f"[断点] 今日已完成 {len(self.completed)} 个账号，将跳过")
+
+    def pending(self, accounts):
+        """过滤掉今天已经成功的账号"""
+        for account in accounts:
+            if account['username'] in self.completed:
+                self.skipped += 1
+                continue
+            yield account
+
+    def record(self, username: str, outcome: str):
+        """追加一条记录并立即落盘"""
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({
+                "username": username,
+                "status": outcome,
+                "time": datetime.now(pytz.timezone('Asia/Shanghai')).strftime("%Y-%m-%d %H:%M:%S"),
+            }, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if outcome == OUTCOME_OK:
+            self.completed.add(username)
+
+
+def load_account_state() -> dict:
+    """读取上次运行记录的账号状态"""
+    try:
+        with open(ACCOUNT_STATE_FILE, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"[状态] 读取账号状态失败: {e}")
+        return {}
+
+
+def save_account_state(state: dict):
+    """保存账号状态"""
+    try:
+        os.makedirs(STATE_DIR, exist_ok=True)
+        with open(ACCOUNT_STATE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"[状态] 保存账号状态失败: {e}")
+
+
+def parse_int(value):
+    """从 "12"、"12 天" 之类的文本中取出整数，取不到返回 None"""
+    match = re.search(r'-?\d+', str(value))
+    return int(match.group()) if match else None
+
+
+def account_priority(username: str, state: dict) -> tuple:
+    """
+    计算账号优先级，值越小越优先
+    上次失败或超时（连续签到有中断风险）> 剩余天数不足 > 其他；同级按连续签到天数从长到短
+    """
+    info = state.get(username, {})
+    remaining = parse_int(info.get('remaining_days'))
+    streak = parse_int(info.get('continuous_days')) or 0
+
+    if info.get('last_status') in (OUTCOME_FAILED, OUTCOME_TIMEOUT):
+        tier = 0
+    elif remaining is not None and remaining <= RISK_DAYS:
+        tier = 1
+    else:
+        tier = 2
+    return tier, -streak
+
+
+class CheckinScheduler:
+    """
+    账号签到调度器
+    从账号源按批读取账号，批内按优先级分配到时间窗口内的启动时刻（带随机抖动），
+    由固定数量的 worker 并发执行，失败的账号会重新排队
+    """
+
+    def __init__(self, concurrency: int = MAX_CONCURRENCY, window: float = SCHEDULE_BATCH_WINDOW,
+                 jitter: float = SCHEDULE_JITTER, max_requeue: int = MAX_REQUEUE,
+                 requeue_delay: float = REQUEUE_DELAY, batch_size: int = SCHEDULE_BATCH):
+        self.concurrency = max(1, concurrency)
+        self.window = max(0.0, window)
+        self.jitter = max(0.0, jitter)
+        self.max_requeue = max_requeue
+        self.requeue_delay = requeue_delay
+        self.batch_size = max(1, batch_size)
+        self.queue = []  # 堆：(计划开始时间, 优先级, 序号, 账号, 第几次尝试)
+        self.seq = 0
+        self.fresh = 0  # 队列中尚未开始的新账号数
+        self.source = None
+        self.state = {}
+        self.refill_lock = asyncio.Lock()
+        self.running = 0
+        self.started_at = None
+        self.latencies = []
+        self.succeeded = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.requeued = 0
+
+    def _push(self, due: float, priority: tuple, account: dict, attempt: int):
+        heapq.heappush(self.queue, (due, priority, self.seq, account, attempt))
+        self.seq += 1
+
+    def _pop(self) -> tuple:
+        """取出下一个账号：已到时间的账号中优先级最高的先执行，都没到时间则取最早的"""
+        now = time.monotonic()
+        ready = [entry for entry in self.queue if entry[0] <= now]
+        if not ready:
+            return heapq.heappop(self.queue)
+        entry = min(ready, key=lambda e: (e[1], e[0], e[2]))
+        self.queue.remove(entry)
+        heapq.heapify(self.queue)
+        return entry
+
+    def submit(self, accounts: list, state: dict):
+        """按优先级排序一批账号，并在这一批的时间窗口内分配启动时刻"""
+        ordered = sorted(accounts, key=lambda a: account_priority(a['username'], state))
+        slot = self.window / len(ordered) if ordered else 0
+        now = time.monotonic()
+        for i, account in enumerate(ordered):
+            offset = i * slot + random.uniform(0, self.jitter)
+            self._push(now + offset, account_priority(account['username'], state), account, 1)
+            self.fresh += 1
+            print(f"[调度] {account['username']} 计划在 {offset:.1f}s 后开始")
+
+    async def _refill(self):
+        """
+        队列中的新账号用完后从账号源读取下一批
+        读取在线程池中进行（账号源可能是慢速的标准输入），同一时间只有一个 worker 读取
+        """
+        if self.fresh or self.source is None:
+            return
+        async with self.refill_lock:
+            if self.fresh or self.source is None:
+                return
+            loop = asyncio.get_running_loop()
+            batch = await loop.run_in_executor(None, lambda: list(itertools.islice(self.source, self.batch_size)))
+            if batch:
+                self.submit(batch, self.state)
+            else:
+                self.source = None
+
+    async def run(self, accounts, state: dict, worker, on_final):
+        """
+        执行调度
+        :param accounts: 账号可迭代对象，按批读取，不会一次性载入
+        :param state: 上次运行的账号状态，用于计算优先级
+        :param worker: async worker(account, attempt) -> 结果字典，需包含 ok 字段
+        :param on_final: async on_final(result)，账号得到最终结果（成功或不再重试）时调用
+        """
+        self.source = iter(accounts)
+        self.state = state
+        self.started_at = time.monotonic()
+        await asyncio.gather(*(self._worker_loop(i, worker, on_final) for i in range(self.concurrency)))
+
+    async def _worker_loop(self, index, worker, on_final):
+        while True:
+            await self._refill()
+
+            # 内存压力下超出允许并发的 worker 暂停取任务
+            if index >= MEMORY_MONITOR.allowed(self.concurrency):
+                if not self.queue and self.running == 0:
+                    return
+                await asyncio.sleep(1)
+                continue
+
+            if not self.queue:
+                if self.running == 0:
+                    return
+                await asyncio.sleep(0.5)
+                continue
+
+            due, priority, _, account, attempt = self._pop()
+            if attempt == 1:
+                self.fresh -= 1
+            self.running += 1
+            try:
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self.latencies.append(time.monotonic() - due)
+
+                result = await worker(account, attempt)
+                if result.get('ok'):
+                    self.succeeded += 1
+                    await on_final(result)
+                elif attempt <= self.max_requeue and result.get('requeue', True):
+                    self.requeued += 1
+                    print(f"[调度] {account['username']} 第 {attempt} 次签到失败，{self.requeue_delay:.0f}s 后重新排队")
+                    # 失败账号保持最高优先级：到时间后先于其他已到时间的账号执行
+                    self._push(time.monotonic() + self.requeue_delay, (0,) + priority[1:], account, attempt + 1)
+                else:
+                    self.failed += 1
+                    if result.get('outcome') == OUTCOME_TIMEOUT:
+                        self.timeouts += 1
+                    await on_final(result)
+            finally:
+                self.running -= 1
+
+    def report(self):
+        """打印调度统计"""
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0
+        print(f"[调度] 成功 {self.succeeded}，失败 {self.failed}（其中超时 {self.timeouts}），重新排队 {self.requeued}，总耗时 {elapsed:.1f}s")
+        if self.latencies:
+            avg = sum(self.latencies) / len(self.latencies)
+            print(f"[调度] 队列延迟：平均 {avg:.2f}s，最大 {max(self.latencies):.2f}s")
+        print(f"[调度] {SITE_LIMITER.report()}")
+        print(f"[调度] {SOLVER_LIMITER.report()}")
+        if MEMORY_MONITOR.enabled:
+            print(f"[内存] {MEMORY_MONITOR.report()}")
+
+
+def shot_path(name: str, tag: str = "") -> str:
+    """截图文件名，多账号时加上账号标识避免互相覆盖"""
+    return f"{tag}_{name}" if tag else name
+
+
+async def navigate(key: str, action):
+    """
+    执行一次受站点限速约束的导航动作，超时时间按 key 的历史耗时自适应
+    :param action: 接收超时时间（毫秒）的协程函数
+    """
+    await SITE_LIMITER.acquire()
+    timeout = TIMEOUTS.timeout(key)
+    start = time.monotonic()
+    try:
+        await action(timeout * 1000)
+    except PlaywrightTimeoutError:
+        TIMEOUTS.record_timeout(key, timeout)
+        raise
+    TIMEOUTS.record(key, time.monotonic() - start)
+
+
+async def goto(page, url: str):
+    """页面跳转"""
+    await navigate(f"goto:{urlparse(url).path}", lambda ms: page.goto(url, wait_until='networkidle', timeout=ms))
+
+
+async def reload(page):
+    """刷新当前页面"""
+    await navigate(f"reload:{urlparse(page.url).path}", lambda ms: page.reload(timeout=ms))
+
+
+async def send_telegram(message: str) -> bool:
+    """发送 Telegram 通知，返回是否发送成功（未配置时视为成功）"""
     if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
         print("[通知] 未配置 Telegram Bot，跳过发送。")
-        return
+        return True
 
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
@@ -45,13 +923,20 @@ def send_telegram(message: str):
             "text": message,
             "parse_mode": "Markdown"
         }
-        response = requests.post(url, json=payload, timeout=10)
+        timeout = TIMEOUTS.timeout('telegram')
+        start = time.monotonic()
+        response = await http_client().post(url, json=payload, timeout=timeout)
+        TIMEOUTS.record('telegram', time.monotonic() - start)
         if response.status_code == 200:
             print("[通知] Telegram 消息已发送。")
-        else:
-            print(f"[通知] Telegram 发送失败，状态码：{response.status_code}")
+            return True
+        print(f"[通知] Telegram 发送失败，状态码：{response.status_code}")
+    except httpx.TimeoutException:
+        TIMEOUTS.record_timeout('telegram', timeout)
+        print(f"[通知] ⏱️ Telegram 发送超时（{timeout:.1f}s）")
     except Exception as e:
         print(f"[通知异常] Telegram：{str(e)}")
+    return False
 
 
 def compress_base64_image(base64_str: str, max_size_kb: int = 50, quality: int = 85) -> str:
@@ -141,10 +1026,11 @@ def compress_base64_image(base64_str: str, max_size_kb: int = 50, quality: int =
         return base64_str
 
 
-def find_gap_position(bg_base64: str, slider_base64: str) -> int:
+async def find_gap_position(bg_base64: str, slider_base64: str, tape: CaptchaTape = None) -> int:
     """
     使用远程 API 找到滑块缺口位置
     返回缺口的 x 坐标
+    图片压缩在线程池中进行，API 请求使用异步客户端，不阻塞其他账号
     """
     try:
         print("[滑块] 正在调用缺口识别 API...")
@@ -152,26 +1038,57 @@ def find_gap_position(bg_base64: str, slider_base64: str) -> int:
         print(f"[滑块] 原始滑块图大小: {len(slider_base64)}")
 
         # 压缩图片以避免 413 错误
-        compressed_bg = compress_base64_image(bg_base64, max_size_kb=50)
-        compressed_slider = compress_base64_image(slider_base64, max_size_kb=30)
+        loop = asyncio.get_running_loop()
+        compressed_bg, compressed_slider = await asyncio.gather(
+            loop.run_in_executor(IMAGE_POOL, compress_base64_image, bg_base64, 50),
+            loop.run_in_executor(IMAGE_POOL, compress_base64_image, slider_base64, 30),
+        )
 
         print(f"[滑块] 压缩后背景图大小: {len(compressed_bg)}")
         print(f"[滑块] 压缩后滑块图大小: {len(compressed_slider)}")
 
-        # 调用 API（使用 JSON 格式）
-        response = requests.post(
-            SLIDER_API_URL,
-            json={
-                "bg": compressed_bg,
-                "front": compressed_slider
-            },
-            timeout=30
-        )
+        if tape and tape.mode == 'replay':
+            # 回放录制的 API 响应，不访问网络
+            status_code, result, error = tape.next()
+            print("[回放] 使用录制的识别结果")
+            if error == 'timeout':
+                print("[滑块] ⏱️ 录制时 API 请求超时，使用默认偏移")
+                return random.randint(150, 280)
+            if error:
+                raise RuntimeError(error)
+        else:
+            # 调用 API（使用 JSON 格式）
+            await SOLVER_LIMITER.acquire()
+            timeout = TIMEOUTS.timeout('solver_api')
+            start = time.monotonic()
+            try:
+                response = await http_client().post(
+                    SLIDER_API_URL,
+                    json={
+                        "bg": compressed_bg,
+                        "front": compressed_slider
+                    },
+                    timeout=timeout
+                )
+                TIMEOUTS.record('solver_api', time.monotonic() - start)
+                status_code = response.status_code
+                result = response.json() if status_code == 200 else None
+            except httpx.TimeoutException:
+                TIMEOUTS.record_timeout('solver_api', timeout)
+                if tape:
+                    tape.record(compressed_bg, compressed_slider, None, None, error='timeout')
+                print(f"[滑块] ⏱️ API 请求超时（{timeout:.1f}s），使用默认偏移")
+                return random.randint(150, 280)
+            except Exception as e:
+                if tape:
+                    tape.record(compressed_bg, compressed_slider, None, None, error=str(e) or type(e).__name__)
+                raise
+            if tape:
+                tape.record(compressed_bg, compressed_slider, status_code, result)
 
-        print(f"[滑块] API 响应状态: {response.status_code}")
+        print(f"[滑块] API 响应状态: {status_code}")
 
-        if response.status_code == 200:
-            result = response.json()
+        if status_code == 200:
             print(f"[滑块] API 返回数据: {result}")
 
             # 解析返回结果：{'code': 0, 'result': x}
@@ -188,7 +1105,7 @@ def find_gap_position(bg_base64: str, slider_base64: str) -> int:
                 print("[滑块] API 返回格式异常")
                 return random.randint(150, 280)
         else:
-            print(f"[滑块] API 请求失败，状态码: {response.status_code}")
+            print(f"[滑块] API 请求失败，状态码: {status_code}")
             return random.randint(150, 280)
 
     except Exception as e:
@@ -241,33 +1158,38 @@ def generate_human_track(distance: int) -> list:
     return track
 
 
-async def solve_slider_captcha(page) -> bool:
+async def solve_slider_captcha(page, tag: str = "", tape: CaptchaTape = None, timeout: float = None) -> str:
     """
     解决滑块验证码
     流程：等待滑块出现 -> 获取图片 -> 调用API计算距离 -> 模拟拖动
+    返回 OUTCOME_OK / OUTCOME_FAILED；滑块在超时时间内没有出现时返回 OUTCOME_TIMEOUT，
+    超时由调用方在确认签到状态后统计
     """
     try:
         print("[滑块] 等待滑块验证码出现...")
 
         # 等待滑块手柄出现
         slider_element = None
+        timeout = timeout or TIMEOUTS.timeout('slider')
+        start = time.monotonic()
         try:
-            slider_element = await page.wait_for_selector('#sliderHandle', timeout=5000)
+            slider_element = await page.wait_for_selector('#sliderHandle', timeout=timeout * 1000)
             if slider_element:
+                TIMEOUTS.record('slider', time.monotonic() - start)
                 print("[滑块] 找到滑块元素: #sliderHandle")
-        except:
-            print("[滑块] 未找到滑块元素，可能不需要验证或已签到")
-            return True
+        except PlaywrightTimeoutError:
+            print(f"[滑块] ⏱️ 等待滑块超时（{timeout:.1f}s），可能不需要验证或已签到")
+            return OUTCOME_TIMEOUT
 
         if not slider_element:
-            return True
+            return OUTCOME_OK
 
         # 等待一下让图片加载完成
         await asyncio.sleep(0.5)
 
         # 截图保存当前状态
-        await page.screenshot(path='slider_captcha.png')
-        print("[滑块] 已保存滑块截图: slider_captcha.png")
+        await page.screenshot(path=shot_path('slider_captcha.png', tag))
+        print(f"[滑块] 已保存滑块截图: {shot_path('slider_captcha.png', tag)}")
 
         # 获取背景图和滑块图
         bg_base64 = None
@@ -331,7 +1253,7 @@ async def solve_slider_captcha(page) -> bool:
 
         # 计算滑动距离
         if bg_base64 and slider_base64:
-            gap_x = find_gap_position(bg_base64, slider_base64)
+            gap_x = await find_gap_position(bg_base64, slider_base64, tape)
 
             # 获取滑块拼图的初始位置（通常在左侧）
             slider_puzzle = await page.query_selector('#sliderPuzzle')
@@ -384,7 +1306,7 @@ async def solve_slider_captcha(page) -> bool:
         box = await slider_element.bounding_box()
         if not box:
             print("[滑块] 无法获取滑块位置")
-            return False
+            return OUTCOME_FAILED
 
         start_x = box['x'] + box['width'] / 2
         start_y = box['y'] + box['height'] / 2
@@ -418,8 +1340,8 @@ async def solve_slider_captcha(page) -> bool:
         await asyncio.sleep(1.5)
 
         # 截图保存滑动后状态
-        await page.screenshot(path='slider_after.png')
-        print("[滑块] 已保存滑动后截图: slider_after.png")
+        await page.screenshot(path=shot_path('slider_after.png', tag))
+        print(f"[滑块] 已保存滑动后截图: {shot_path('slider_after.png', tag)}")
 
         # 检查是否验证成功
         # 如果滑块消失，说明验证成功
@@ -427,7 +1349,7 @@ async def solve_slider_captcha(page) -> bool:
             still_visible = await page.query_selector('#sliderHandle')
             if not still_visible:
                 print("[滑块] ✅ 验证成功（滑块已消失）")
-                return True
+                return OUTCOME_OK
         except:
             pass
 
@@ -435,391 +1357,776 @@ async def solve_slider_captcha(page) -> bool:
         page_content = await page.content()
         if '验证成功' in page_content or '签到成功' in page_content:
             print("[滑块] ✅ 验证成功")
-            return True
+            return OUTCOME_OK
 
         print("[滑块] 验证状态未知，继续执行")
-        return True
+        return OUTCOME_OK
 
     except Exception as e:
         print(f"[滑块] 处理异常: {str(e)}")
         import traceback
         traceback.print_exc()
-        return False
+        return OUTCOME_FAILED
 
 
-async def main():
-    """主函数"""
-    beijing_tz = pytz.timezone('Asia/Shanghai')
-    now = datetime.now(beijing_tz).strftime("%Y-%m-%d %H:%M:%S")
+class StageTimer:
+    """
+    记录单个账号各阶段的耗时
+    每个阶段保存为 (名称, 开始, 结束, 是否子阶段) 区间，时间为相对账号开始的秒数
+    阶段可以并行执行，子阶段（如 solve）包含在其他阶段内，不参与重叠计算
+    """
 
-    api_link = "未知"
-    expire_time_str = "未知"
-    remaining_days = "未知"
-    sign_msg = ""
-    today_sign_count = "未知"
-    continuous_days = "未知"
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.spans = []
+        self.finished_at = None
+        self.retries = {}  # 阶段 -> 重试次数
+        self.backoff = {}  # 阶段 -> 退避等待时间（秒）
+        self.exhausted = set()  # 用完重试次数仍失败的阶段
+
+    def retried(self, name: str, delay: float):
+        self.retries[name] = self.retries.get(name, 0) + 1
+        self.backoff[name] = self.backoff.get(name, 0.0) + delay
+
+    @contextmanager
+    def stage(self, name: str, sub: bool = False):
+        start = time.monotonic() - self.origin
+        try:
+            yield
+        finally:
+            self.spans.append((name, start, time.monotonic() - self.origin, sub))
+
+    def finish(self):
+        self.finished_at = time.monotonic() - self.origin
+
+    def overlap(self) -> float:
+        """并行阶段重叠的时间：各阶段耗时之和减去实际占用的时间"""
+        spans = sorted((start, end) for _, start, end, sub in self.spans if not sub)
+        busy = 0.0
+        cover_start = cover_end = None
+        for start, end in spans:
+            if cover_end is None or start > cover_end:
+                if cover_end is not None:
+                    busy += cover_end - cover_start
+                cover_start, cover_end = start, end
+            else:
+                cover_end = max(cover_end, end)
+        if cover_end is not None:
+            busy += cover_end - cover_start
+        return sum(end - start for start, end in spans) - busy
+
+    def durations(self) -> dict:
+        """各阶段累计耗时（秒），total 为账号总耗时，overlap 为阶段并行节省的时间"""
+        result = {}
+        for name, start, end, _ in self.spans:
+            result[name] = result.get(name, 0.0) + end - start
+        result['overlap'] = self.overlap()
+        result['backoff'] = sum(self.backoff.values())
+        result['total'] = self.finished_at if self.finished_at is not None else time.monotonic() - self.origin
+        return result
+
+    def report(self) -> str:
+        timeline = "，".join(f"{name} {start:.2f}-{end:.2f}s" for name, start, end, _ in sorted(self.spans, key=lambda s: s[1]))
+        durations = self.durations()
+        retries = "".join(f"，{name} 重试 {count} 次（退避 {self.backoff[name]:.1f}s）"
+                          for name, count in self.retries.items())
+        return f"{timeline}（并行重叠 {durations['overlap']:.2f}s，总耗时 {durations['total']:.2f}s{retries}）"
+
+
+# 全部账号的阶段重试统计：阶段 -> [重试次数, 退避等待时间]
+RETRY_STATS = {}
+
+
+async def run_stage(name: str, attempt, timer: StageTimer = None, retry_if=None):
+    """
+    执行一个阶段，失败时按指数退避（带随机抖动）只重试该阶段
+    :param attempt: 无参协程函数，每次尝试重新调用
+    :param retry_if: 可选，根据返回值判断是否需要重试；重试次数用完后返回最后一次的结果
+    """
+    # 回放时不做阶段重试，避免退避的随机等待影响耗时对比
+    retries = STAGE_RETRIES.get(name, 0) if RUN_MODE != 'replay' else 0
+    for i in range(retries + 1):
+        try:
+            if timer:
+                with timer.stage(name):
+                    result = await attempt()
+            else:
+                result = await attempt()
+            if retry_if is None or not retry_if(result):
+                return result
+            if i >= retries:
+                if timer and retries:
+                    timer.exhausted.add(name)
+                return result
+            reason = "结果未达预期"
+        except Exception as e:
+            if i >= retries:
+                if timer and retries:
+                    timer.exhausted.add(name)
+                raise
+            reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+
+        # 先加抖动再限制上限，保证退避不超过 RETRY_MAX_DELAY
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** i * random.uniform(0.5, 1.5))
+        print(f"[重试] {name} 阶段失败（{reason}），{delay:.1f}s 后第 {i + 1}/{retries} 次重试")
+        if timer:
+            timer.retried(name, delay)
+        stats = RETRY_STATS.setdefault(name, [0, 0.0])
+        stats[0] += 1
+        stats[1] += delay
+        await asyncio.sleep(delay)
+
+
+def print_retry_stats():
+    for name, (count, backoff) in RETRY_STATS.items():
+        print(f"[重试] {name}: 重试 {count} 次，退避 {backoff:.1f}s")
+
+
+def load_timings(path: str) -> dict:
+    """读取阶段耗时文件，返回 {用户名: {阶段: 秒}}"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('accounts', {})
+
+
+def save_timings(path: str, timings: dict):
+    """保存阶段耗时文件"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            "mode": RUN_MODE,
+            "time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "accounts": timings,
+        }, f, ensure_ascii=False, indent=2)
+
+
+def print_timing_diff(before: dict, after: dict):
+    """按阶段对比两次运行的平均耗时（只统计两次都有的账号）"""
+    common = [name for name in after if name in before]
+    if not common:
+        print("[耗时对比] 两次运行没有相同的账号，无法对比")
+        return
 
-    async with async_playwright() as p:
-        # 启动浏览器
-        print("[浏览器] 正在启动...")
-        browser = await p.chromium.launch(
-            headless=HEADLESS,
-            args=['--disable-blink-features=AutomationControlled']
-        )
+    stages = []
+    for name in common:
+        for stage in list(before[name]) + list(after[name]):
+            if stage not in stages:
+                stages.append(stage)
+
+    print(f"[耗时对比] 账号数: {len(common)}")
+    print(f"[耗时对比] {'阶段':<12}{'之前':>10}{'之后':>10}{'变化':>12}")
+    for stage in stages:
+        old = sum(before[name].get(stage, 0.0) for name in common) / len(common)
+        new = sum(after[name].get(stage, 0.0) for name in common) / len(common)
+        delta = new - old
+        percent = f"({delta / old * 100:+.1f}%)" if old else ""
+        print(f"[耗时对比] {stage:<12}{old:>9.2f}s{new:>9.2f}s{delta:>+11.2f}s {percent}")
+
+
+async def stage_login(page, account: dict, tag: str = "") -> bool:
+    """登录阶段，返回是否登录成功"""
+    print("[登录] 正在打开登录页面...")
+    await goto(page, f"{BASE_URL}/user/login")
+    await asyncio.sleep(1)
+
+    # 填写用户名密码
+    print("[登录] 填写登录信息...")
+    await page.fill('input[name="username"]', account['username'])
+    await page.fill('input[name="password"]', account['password'])
+
+    # 处理验证码输入（如果有）
+    captcha_input = await page.query_selector('input[name="login_token"]')
+    if captcha_input:
+        await captcha_input.fill("小满")
+
+    # 点击登录按钮
+    await navigate(f"submit:{urlparse(page.url).path}", lambda ms: page.click('button[type="submit"]', timeout=ms))
+    await asyncio.sleep(2)
+
+    # 检查是否登录成功
+    current_url = page.url
+    if 'dashboard' in current_url or 'login' not in current_url:
+        print("[登录] ✅ 登录成功！")
+        return True
 
-        context = await browser.new_context(
-            viewport={'width': 1280, 'height': 800},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
+    print("[登录] ⚠️ 可能登录失败，继续尝试...")
+    await page.screenshot(path=shot_path('login_result.png', tag))
+    return False
 
-        # 注入反检测脚本
-        await context.add_init_script('''
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-        ''')
 
-        page = await context.new_page()
+async def stage_dashboard(page, username: str = "", tag: str = "") -> dict:
+    """获取用户信息阶段，返回 API 链接、到期时间和剩余天数"""
+    beijing_tz = pytz.timezone('Asia/Shanghai')
+    info = {}
+
+    print("[信息] 正在获取用户信息...")
+    await goto(page, f"{BASE_URL}/dashboard")
+    MEMORY_MONITOR.sample(username)
+    await asyncio.sleep(1)
+
+    # 保存 dashboard 截图用于调试
+    await page.screenshot(path=shot_path('dashboard_page.png', tag))
+    print(f"[调试] 已保存 dashboard 页面截图: {shot_path('dashboard_page.png', tag)}")
+
+    # 使用 JavaScript 获取用户信息（更可靠的方式）
+    user_info = await page.evaluate('''() => {
+        const result = {
+            apiLink: null,
+            expireTime: null,
+            debug: []
+        };
+
+        // 获取 API 链接 - 多种选择器尝试
+        const apiSelectors = [
+            '#tvboxLinkContainer .endpoint-url code',
+            '.endpoint-url code',
+            '#tvboxLinkContainer code',
+            '.api-link code',
+            'code[class*="endpoint"]',
+            '.card-body code'
+        ];
+
+        for (const selector of apiSelectors) {
+            const el = document.querySelector(selector);
+            if (el && el.innerText.trim()) {
+                result.apiLink = el.innerText.trim();
+                result.debug.push(`API链接选择器命中: ${selector}`);
+                break;
+            }
+        }
 
-        try:
-            # ========== 登录 ==========
-            print("[登录] 正在打开登录页面...")
-            await page.goto(f"{BASE_URL}/user/login", wait_until='networkidle')
-            await asyncio.sleep(1)
+        // 如果还没找到，尝试从所有 code 标签中查找包含 http 的
+        if (!result.apiLink) {
+            const allCodes = document.querySelectorAll('code');
+            for (const code of allCodes) {
+                const text = code.innerText.trim();
+                if (text.includes('http') && text.includes('/')) {
+                    result.apiLink = text;
+                    result.debug.push(`从 code 标签找到 API 链接`);
+                    break;
+                }
+            }
+        }
 
-            # 填写用户名密码
-            print("[登录] 填写登录信息...")
-            await page.fill('input[name="username"]', USERNAME)
-            await page.fill('input[name="password"]', PASSWORD)
+        // 获取到期时间 - 多种选择器尝试
+        const expireSelectors = [
+            '.expire-time',
+            '.expiry-time',
+            '.expire-date',
+            '[class*="expire"]',
+            '.subscription-expire',
+            '.vip-expire'
+        ];
+
+        for (const selector of expireSelectors) {
+            const el = document.querySelector(selector);
+            if (el && el.innerText.trim()) {
+                result.expireTime = el.innerText.trim();
+                result.debug.push(`到期时间选择器命中: ${selector}`);
+                break;
+            }
+        }
 
-            # 处理验证码输入（如果有）
-            captcha_input = await page.query_selector('input[name="login_token"]')
-            if captcha_input:
-                await captcha_input.fill("小满")
+        // 如果还没找到，尝试从页面文本中匹配日期格式
+        if (!result.expireTime) {
+            const bodyText = document.body.innerText;
+            // 匹配 YYYY-MM-DD HH:MM:SS 格式
+            const dateMatch = bodyText.match(/(\\d{4}-\\d{2}-\\d{2}\\s+\\d{2}:\\d{2}:\\d{2})/);
+            if (dateMatch) {
+                result.expireTime = dateMatch[1];
+                result.debug.push(`从页面文本匹配到日期: ${dateMatch[1]}`);
+            }
+        }
 
-            # 点击登录按钮
-            await page.click('button[type="submit"]')
-            await asyncio.sleep(2)
+        // 调试：列出页面上的关键元素
+        result.debug.push(`页面标题: ${document.title}`);
+        const cards = document.querySelectorAll('.card, .panel, .box');
+        result.debug.push(`找到 ${cards.length} 个卡片/面板元素`);
+
+        return result;
+    }''')
+
+    # 打印调试信息
+    if user_info.get('debug'):
+        for debug_msg in user_info['debug']:
+            print(f"[调试] {debug_msg}")
+
+    # 获取 API 链接
+    if user_info.get('apiLink'):
+        info['api_link'] = user_info['apiLink']
+        print(f"[信息] API链接: {info['api_link']}")
+    else:
+        print("[信息] 未找到 API 链接")
+
+    # 获取到期时间
+    if user_info.get('expireTime'):
+        expire_time_str = user_info['expireTime']
+        info['expire_time_str'] = expire_time_str
+        print(f"[信息] 到期时间: {expire_time_str}")
+
+        # 计算剩余天数
+        try:
+            expire_time = datetime.strptime(expire_time_str, "%Y-%m-%d %H:%M:%S")
+            expire_time = expire_time.replace(tzinfo=beijing_tz)
+            info['remaining_days'] = (expire_time - datetime.now(beijing_tz)).days + 1
+            print(f"[信息] 剩余天数: {info['remaining_days']}")
+        except Exception as e:
+            print(f"[信息] 计算剩余天数失败: {e}")
+    else:
+        print("[信息] 未找到到期时间")
 
-            # 检查是否登录成功
-            current_url = page.url
-            if 'dashboard' in current_url or 'login' not in current_url:
-                print("[登录] ✅ 登录成功！")
-            else:
-                print("[登录] ⚠️ 可能登录失败，继续尝试...")
-                await page.screenshot(path='login_result.png')
+    return info
 
-            # ========== 获取用户信息 ==========
-            print("[信息] 正在获取用户信息...")
-            await page.goto(f"{BASE_URL}/dashboard", wait_until='networkidle')
+
+async def stage_signin(page, tag: str = "", timer: StageTimer = None, tape=None) -> tuple:
+    """签到阶段，返回 (签到消息, 签到结果 OUTCOME_*)"""
+    timer = timer or StageTimer()
+    sign_msg = ""
+    outcome = OUTCOME_FAILED
+    timed_out = False
+
+    print("[签到] 正在打开签到页面...")
+    await goto(page, f"{BASE_URL}/signin")
+    await asyncio.sleep(1)
+
+    # 截图查看页面状态
+    await page.screenshot(path=shot_path('signin_page.png', tag))
+    print(f"[调试] 已保存签到页面截图: {shot_path('signin_page.png', tag)}")
+
+    # 尝试多次验证
+    max_attempts = 3
+    for attempt in range(max_attempts):
+        print(f"[签到] 第 {attempt + 1}/{max_attempts} 次尝试...")
+
+        # 1. 先点击签到按钮，触发滑块验证
+        sign_btn = await page.query_selector('#signinButton')
+        if sign_btn:
+            await sign_btn.click()
+            print("[签到] 点击签到按钮，等待滑块验证弹出...")
+            await asyncio.sleep(1)
+        else:
+            print("[签到] 未找到签到按钮")
+            break
+
+        # 2. 等待滑块出现并处理验证
+        slider_timeout = TIMEOUTS.timeout('slider')
+        with timer.stage('solve', sub=True):
+            slider_result = await solve_slider_captcha(page, tag, tape, slider_timeout)
+
+        if slider_result == OUTCOME_TIMEOUT:
+            # 滑块没有出现：可能已经签到，继续检查签到状态
+            timed_out = True
+        elif slider_result != OUTCOME_OK:
+            print("[签到] 滑块验证失败，重试...")
+            await reload(page)
             await asyncio.sleep(1)
+            continue
 
-            # 保存 dashboard 截图用于调试
-            await page.screenshot(path='dashboard_page.png')
-            print("[调试] 已保存 dashboard 页面截图: dashboard_page.png")
-
-            # 使用 JavaScript 获取用户信息（更可靠的方式）
-            user_info = await page.evaluate('''() => {
-                const result = {
-                    apiLink: null,
-                    expireTime: null,
-                    debug: []
-                };
-
-                // 获取 API 链接 - 多种选择器尝试
-                const apiSelectors = [
-                    '#tvboxLinkContainer .endpoint-url code',
-                    '.endpoint-url code',
-                    '#tvboxLinkContainer code',
-                    '.api-link code',
-                    'code[class*="endpoint"]',
-                    '.card-body code'
-                ];
-
-                for (const selector of apiSelectors) {
-                    const el = document.querySelector(selector);
-                    if (el && el.innerText.trim()) {
-                        result.apiLink = el.innerText.trim();
-                        result.debug.push(`API链接选择器命中: ${selector}`);
-                        break;
-                    }
-                }
+        await asyncio.sleep(2)
 
-                // 如果还没找到，尝试从所有 code 标签中查找包含 http 的
-                if (!result.apiLink) {
-                    const allCodes = document.querySelectorAll('code');
-                    for (const code of allCodes) {
-                        const text = code.innerText.trim();
-                        if (text.includes('http') && text.includes('/')) {
-                            result.apiLink = text;
-                            result.debug.push(`从 code 标签找到 API 链接`);
-                            break;
-                        }
-                    }
-                }
+        # 3. 检查签到结果
+        # 通过 .signin-action-title 判断签到状态
+        try:
+            action_title = await page.query_selector('.signin-action-title')
+            if action_title:
+                title_text = await action_title.inner_text()
+                if '今日已签到' in title_text:
+                    sign_msg = "🎉 签到成功！"
+                    outcome = OUTCOME_OK
+                    print("[签到] ✅ 检测到签到成功标识")
+        except Exception as e:
+            print(f"[签到] 检查签到状态失败: {e}")
+
+        # 备用检查方式
+        if not sign_msg:
+            page_content = await page.content()
+            if '签到成功' in page_content or '今日已签到' in page_content:
+                sign_msg = "🎉 签到成功！"
+                outcome = OUTCOME_OK
+            elif '已签到' in page_content or '已经签到' in page_content:
+                sign_msg = "ℹ️ 今日已签到"
+                outcome = OUTCOME_OK
+
+        if slider_result == OUTCOME_TIMEOUT:
+            if sign_msg:
+                # 已签到时滑块本来就不会出现，只统计超时，不计入样本
+                TIMEOUTS.count_timeout('slider')
+            else:
+                # 仍未签到说明滑块出现得太慢：按超时时间计入样本，使后续等待逐步放宽
+                TIMEOUTS.record_timeout('slider', slider_timeout)
 
-                // 获取到期时间 - 多种选择器尝试
-                const expireSelectors = [
-                    '.expire-time',
-                    '.expiry-time',
-                    '.expire-date',
-                    '[class*="expire"]',
-                    '.subscription-expire',
-                    '.vip-expire'
-                ];
-
-                for (const selector of expireSelectors) {
-                    const el = document.querySelector(selector);
-                    if (el && el.innerText.trim()) {
-                        result.expireTime = el.innerText.trim();
-                        result.debug.push(`到期时间选择器命中: ${selector}`);
-                        break;
-                    }
-                }
+        if sign_msg:
+            break
+        else:
+            if attempt < max_attempts - 1:
+                print("[签到] 未检测到成功，重试...")
+                await reload(page)
+                await asyncio.sleep(1)
 
-                // 如果还没找到，尝试从页面文本中匹配日期格式
-                if (!result.expireTime) {
-                    const bodyText = document.body.innerText;
-                    // 匹配 YYYY-MM-DD HH:MM:SS 格式
-                    const dateMatch = bodyText.match(/(\\d{4}-\\d{2}-\\d{2}\\s+\\d{2}:\\d{2}:\\d{2})/);
-                    if (dateMatch) {
-                        result.expireTime = dateMatch[1];
-                        result.debug.push(`从页面文本匹配到日期: ${dateMatch[1]}`);
+    if not sign_msg:
+        if timed_out:
+            outcome = OUTCOME_TIMEOUT
+            sign_msg = "⏱️ 等待滑块验证码超时，请手动检查"
+        else:
+            sign_msg = "⚠️ 签到状态未知，请手动检查"
+
+    return sign_msg, outcome
+
+
+async def stage_stats(page) -> dict:
+    """获取签到统计信息阶段，返回今日签到次数和连续签到天数"""
+    stats = {}
+
+    print("[签到] 正在获取签到统计信息...")
+    # 刷新页面以获取最新数据
+    await goto(page, f"{BASE_URL}/signin")
+    await asyncio.sleep(1)
+
+    # 使用 JavaScript 获取签到统计信息（更可靠的方式）
+    signin_stats = await page.evaluate('''() => {
+        const result = {
+            todayCount: null,
+            continuousDays: null,
+            debug: []
+        };
+
+        // 方法1: 尝试从 .signed-info-compact 结构获取
+        const infoItems = document.querySelectorAll('.signed-info-compact .signed-info-item');
+        result.debug.push(`找到 ${infoItems.length} 个 signed-info-item 元素`);
+
+        infoItems.forEach((item, index) => {
+            const label = item.querySelector('.info-label');
+            const value = item.querySelector('.info-value');
+            if (label && value) {
+                const labelText = label.innerText.trim();
+                const valueText = value.innerText.trim();
+                result.debug.push(`Item ${index}: ${labelText} = ${valueText}`);
+
+                if (labelText.includes('今日') || labelText.includes('次数')) {
+                    result.todayCount = valueText;
+                }
+                if (labelText.includes('连续') || labelText.includes('天数')) {
+                    result.continuousDays = valueText;
+                }
+            }
+        });
+
+        // 方法2: 尝试从其他可能的结构获取
+        if (!result.todayCount || !result.continuousDays) {
+            const allInfoValues = document.querySelectorAll('.info-value');
+            result.debug.push(`找到 ${allInfoValues.length} 个 info-value 元素`);
+
+            allInfoValues.forEach((el, index) => {
+                const parent = el.parentElement;
+                if (parent) {
+                    const labelEl = parent.querySelector('.info-label');
+                    if (labelEl) {
+                        const labelText = labelEl.innerText.trim();
+                        const valueText = el.innerText.trim();
+                        result.debug.push(`InfoValue ${index}: ${labelText} = ${valueText}`);
+
+                        if (!result.todayCount && (labelText.includes('今日') || labelText.includes('次数'))) {
+                            result.todayCount = valueText;
+                        }
+                        if (!result.continuousDays && (labelText.includes('连续') || labelText.includes('天数'))) {
+                            result.continuousDays = valueText;
+                        }
                     }
                 }
+            });
+        }
 
-                // 调试：列出页面上的关键元素
-                result.debug.push(`页面标题: ${document.title}`);
-                const cards = document.querySelectorAll('.card, .panel, .box');
-                result.debug.push(`找到 ${cards.length} 个卡片/面板元素`);
-
-                return result;
-            }''')
+        // 方法3: 尝试从页面文本中提取
+        if (!result.continuousDays) {
+            const bodyText = document.body.innerText;
+            const continuousMatch = bodyText.match(/连续[签到]*[：:]*\\s*(\\d+)\\s*天?/);
+            if (continuousMatch) {
+                result.continuousDays = continuousMatch[1];
+                result.debug.push(`从页面文本匹配到连续签到: ${continuousMatch[1]}`);
+            }
+        }
 
-            # 打印调试信息
-            if user_info.get('debug'):
-                for debug_msg in user_info['debug']:
-                    print(f"[调试] {debug_msg}")
+        return result;
+    }''')
 
-            # 获取 API 链接
-            if user_info.get('apiLink'):
-                api_link = user_info['apiLink']
-                print(f"[信息] API链接: {api_link}")
-            else:
-                print("[信息] 未找到 API 链接")
+    # 打印调试信息
+    if signin_stats.get('debug'):
+        for debug_msg in signin_stats['debug']:
+            print(f"[调试] {debug_msg}")
 
-            # 获取到期时间
-            if user_info.get('expireTime'):
-                expire_time_str = user_info['expireTime']
-                print(f"[信息] 到期时间: {expire_time_str}")
+    # 获取今日签到次数
+    if signin_stats.get('todayCount'):
+        stats['today_sign_count'] = signin_stats['todayCount']
+        print(f"[签到] 今日签到次数: {stats['today_sign_count']}")
+    else:
+        print("[签到] 未找到今日签到次数")
 
-                # 计算剩余天数
-                try:
-                    expire_time = datetime.strptime(expire_time_str, "%Y-%m-%d %H:%M:%S")
-                    expire_time = expire_time.replace(tzinfo=beijing_tz)
-                    remaining_days = (expire_time - datetime.now(beijing_tz)).days + 1
-                    print(f"[信息] 剩余天数: {remaining_days}")
-                except Exception as e:
-                    print(f"[信息] 计算剩余天数失败: {e}")
-            else:
-                print("[信息] 未找到到期时间")
+    # 获取连续签到天数
+    if signin_stats.get('continuousDays'):
+        stats['continuous_days'] = signin_stats['continuousDays']
+        print(f"[签到] 连续签到天数: {stats['continuous_days']}")
+    else:
+        print("[签到] 未找到连续签到天数")
 
-            # ========== 签到 ==========
-            print("[签到] 正在打开签到页面...")
-            await page.goto(f"{BASE_URL}/signin", wait_until='networkidle')
-            await asyncio.sleep(1)
+    return stats
 
-            # 截图查看页面状态
-            await page.screenshot(path='signin_page.png')
-            print("[调试] 已保存签到页面截图: signin_page.png")
-
-            # 尝试多次验证
-            max_attempts = 3
-            for attempt in range(max_attempts):
-                print(f"[签到] 第 {attempt + 1}/{max_attempts} 次尝试...")
-
-                # 1. 先点击签到按钮，触发滑块验证
-                sign_btn = await page.query_selector('#signinButton')
-                if sign_btn:
-                    await sign_btn.click()
-                    print("[签到] 点击签到按钮，等待滑块验证弹出...")
-                    await asyncio.sleep(1)
-                else:
-                    print("[签到] 未找到签到按钮")
-                    break
 
-                # 2. 等待滑块出现并处理验证
-                slider_success = await solve_slider_captcha(page)
+async def run_account(browser, account: dict, tag: str = "") -> dict:
+    """单个账号的完整签到流程，在独立的浏览器上下文中执行"""
+    beijing_tz = pytz.timezone('Asia/Shanghai')
+    now = datetime.now(beijing_tz).strftime("%Y-%m-%d %H:%M:%S")
+    username = account['username']
+
+    info = {
+        "api_link": "未知",
+        "expire_time_str": "未知",
+        "remaining_days": "未知",
+        "today_sign_count": "未知",
+        "continuous_days": "未知",
+    }
+    sign_msg = ""
+    outcome = OUTCOME_FAILED
+    timer = StageTimer()
 
-                if not slider_success:
-                    print("[签到] 滑块验证失败，重试...")
-                    await page.reload()
-                    await asyncio.sleep(1)
-                    continue
+    # 录制/回放模式下每个账号对应一份 HAR 和验证码记录
+    har_path = os.path.join(HAR_DIR, f"{safe_name(username)}.har")
+    tape = None
+    if RUN_MODE != 'live':
+        tape = CaptchaTape(os.path.join(HAR_DIR, f"{safe_name(username)}.captcha.jsonl"), RUN_MODE)
 
-                await asyncio.sleep(2)
+    context = await new_account_context(browser, har_path=har_path)
+    MEMORY_MONITOR.contexts += 1
+    page = await context.new_page()
 
-                # 3. 检查签到结果
-                # 通过 .signin-action-title 判断签到状态
+    try:
+        # ========== 登录 ==========
+        logged_in = await run_stage('session', lambda: stage_login(page, account, tag), timer,
+                                    retry_if=lambda logged_in: not logged_in)
+
+        if not logged_in:
+            # 登录重试用完仍未登录：不在未登录的上下文中继续签到和获取统计信息
+            outcome = OUTCOME_FAILED
+            sign_msg = "❌ 登录失败，请检查账号密码或登录页面"
+            print(f"[登录] ❌ {username} 登录失败，跳过签到")
+        else:
+            # 登录后获取用户信息与签到互不依赖：在同一上下文的第二个页面中并行获取用户信息
+            async def dashboard_branch():
+                # ========== 获取用户信息 ==========
+                # 用户信息只用于通知，重试用完后保留"未知"，不影响签到结果
+                dashboard_page = None
+                try:
+                    dashboard_page = await context.new_page()
+                    return await run_stage('dashboard', lambda: stage_dashboard(dashboard_page, username, tag), timer)
+                except Exception as e:
+                    print(f"[信息] 获取用户信息异常: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    return {}
+                finally:
+                    if dashboard_page:
+                        await dashboard_page.close()
+
+            async def signin_branch():
+                signin_page = await next_stage_page(context, page)
+                # ========== 签到 ==========
+                result = await run_stage('signin', lambda: stage_signin(signin_page, tag, timer, tape), timer,
+                                         retry_if=lambda r: r[1] != OUTCOME_OK)
+
+                # ========== 获取签到统计信息 ==========
+                # 统计信息只用于通知，重试用完后不影响签到结果
+                signin_page = await next_stage_page(context, signin_page)
                 try:
-                    action_title = await page.query_selector('.signin-action-title')
-                    if action_title:
-                        title_text = await action_title.inner_text()
-                        if '今日已签到' in title_text:
-                            sign_msg = "🎉 签到成功！"
-                            print("[签到] ✅ 检测到签到成功标识")
-                            break
+                    stats = await run_stage('stats', lambda: stage_stats(signin_page), timer)
                 except Exception as e:
-                    print(f"[签到] 检查签到状态失败: {e}")
+                    print(f"[签到] 获取签到统计信息异常: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    stats = {}
+                return result, stats, signin_page
+
+            # 等两个分支都结束后再处理签到分支的异常，避免关闭上下文时另一分支仍在运行
+            dashboard_result, signin_result = await asyncio.gather(
+                dashboard_branch(), signin_branch(), return_exceptions=True
+            )
+            if isinstance(signin_result, BaseException):
+                raise signin_result
+            if isinstance(dashboard_result, BaseException):
+                dashboard_result = {}
+
+            info.update(dashboard_result)
+            (sign_msg, outcome), stats, page = signin_result
+            info.update(stats)
 
-                # 备用检查方式
-                page_content = await page.content()
-                if '签到成功' in page_content or '今日已签到' in page_content:
-                    sign_msg = "🎉 签到成功！"
-                    break
-                elif '已签到' in page_content or '已经签到' in page_content:
-                    sign_msg = "ℹ️ 今日已签到"
-                    break
-                else:
-                    if attempt < max_attempts - 1:
-                        print("[签到] 未检测到成功，重试...")
-                        await page.reload()
-                        await asyncio.sleep(1)
+            # 保存最终截图
+            await page.screenshot(path=shot_path('signin_result.png', tag))
+            print(f"[调试] 已保存结果截图: {shot_path('signin_result.png', tag)}")
 
-            if not sign_msg:
-                sign_msg = "⚠️ 签到状态未知，请手动检查"
+    except PlaywrightTimeoutError as e:
+        outcome = OUTCOME_TIMEOUT
+        sign_msg = f"⏱️ 执行超时: {str(e).splitlines()[0]}"
+        print(f"[错误] {str(e)}")
+        try:
+            await page.screenshot(path=shot_path('error_screenshot.png', tag))
+        except Exception:
+            pass
 
-            # ========== 获取签到统计信息 ==========
-            print("[签到] 正在获取签到统计信息...")
-            try:
-                # 刷新页面以获取最新数据
-                await page.goto(f"{BASE_URL}/signin", wait_until='networkidle')
-                await asyncio.sleep(1)
+    except Exception as e:
+        outcome = OUTCOME_FAILED
+        sign_msg = f"❌ 执行异常: {str(e)}"
+        print(f"[错误] {str(e)}")
+        import traceback
+        traceback.print_exc()
+        try:
+            await page.screenshot(path=shot_path('error_screenshot.png', tag))
+        except Exception:
+            pass
 
-                # 使用 JavaScript 获取签到统计信息（更可靠的方式）
-                signin_stats = await page.evaluate('''() => {
-                    const result = {
-                        todayCount: null,
-                        continuousDays: null,
-                        debug: []
-                    };
-
-                    // 方法1: 尝试从 .signed-info-compact 结构获取
-                    const infoItems = document.querySelectorAll('.signed-info-compact .signed-info-item');
-                    result.debug.push(`找到 ${infoItems.length} 个 signed-info-item 元素`);
-
-                    infoItems.forEach((item, index) => {
-                        const label = item.querySelector('.info-label');
-                        const value = item.querySelector('.info-value');
-                        if (label && value) {
-                            const labelText = label.innerText.trim();
-                            const valueText = value.innerText.trim();
-                            result.debug.push(`Item ${index}: ${labelText} = ${valueText}`);
-
-                            if (labelText.includes('今日') || labelText.includes('次数')) {
-                                result.todayCount = valueText;
-                            }
-                            if (labelText.includes('连续') || labelText.includes('天数')) {
-                                result.continuousDays = valueText;
-                            }
-                        }
-                    });
-
-                    // 方法2: 尝试从其他可能的结构获取
-                    if (!result.todayCount || !result.continuousDays) {
-                        const allInfoValues = document.querySelectorAll('.info-value');
-                        result.debug.push(`找到 ${allInfoValues.length} 个 info-value 元素`);
-
-                        allInfoValues.forEach((el, index) => {
-                            const parent = el.parentElement;
-                            if (parent) {
-                                const labelEl = parent.querySelector('.info-label');
-                                if (labelEl) {
-                                    const labelText = labelEl.innerText.trim();
-                                    const valueText = el.innerText.trim();
-                                    result.debug.push(`InfoValue ${index}: ${labelText} = ${valueText}`);
-
-                                    if (!result.todayCount && (labelText.includes('今日') || labelText.includes('次数'))) {
-                                        result.todayCount = valueText;
-                                    }
-                                    if (!result.continuousDays && (labelText.includes('连续') || labelText.includes('天数'))) {
-                                        result.continuousDays = valueText;
-                                    }
-                                }
-                            }
-                        });
-                    }
+    finally:
+        await context.close()
+        MEMORY_MONITOR.contexts -= 1
+        timer.finish()
 
-                    // 方法3: 尝试从页面文本中提取
-                    if (!result.continuousDays) {
-                        const bodyText = document.body.innerText;
-                        const continuousMatch = bodyText.match(/连续[签到]*[：:]*\\s*(\\d+)\\s*天?/);
-                        if (continuousMatch) {
-                            result.continuousDays = continuousMatch[1];
-                            result.debug.push(`从页面文本匹配到连续签到: ${continuousMatch[1]}`);
-                        }
-                    }
+    print(f"[耗时] {username}: {timer.report()}")
 
-                    return result;
-                }''')
+    # 整合消息
+    telegram_msg = f"""📅 *逐觅签到通知*
 
-                # 打印调试信息
-                if signin_stats.get('debug'):
-                    for debug_msg in signin_stats['debug']:
-                        print(f"[调试] {debug_msg}")
+👤 用户名：{username}
+🔗 专属链接：{info['api_link']}
+📆 到期时间：{info['expire_time_str']}
+📊 剩余天数：{info['remaining_days']} 天
 
-                # 获取今日签到次数
-                if signin_stats.get('todayCount'):
-                    today_sign_count = signin_stats['todayCount']
-                    print(f"[签到] 今日签到次数: {today_sign_count}")
-                else:
-                    print("[签到] 未找到今日签到次数")
+{sign_msg}
+📈 今日签到次数：{info['today_sign_count']}
+🔥 连续签到天数：{info['continuous_days']}
+🕒 时间：{now}
+"""
 
-                # 获取连续签到天数
-                if signin_stats.get('continuousDays'):
-                    continuous_days = signin_stats['continuousDays']
-                    print(f"[签到] 连续签到天数: {continuous_days}")
-                else:
-                    print("[签到] 未找到连续签到天数")
+    return {
+        "username": username,
+        "ok": outcome == OUTCOME_OK,
+        "outcome": outcome,
+        "sign_msg": sign_msg,
+        "remaining_days": info['remaining_days'],
+        "continuous_days": info['continuous_days'],
+        "message": telegram_msg,
+        "timings": timer.durations(),
+        # 失败由登录/签到阶段重试用完导致时不再整体重新排队，避免重试次数（和识别 API 调用）成倍增加；
+        # 用户信息和统计信息不影响签到结果，不参与判断
+        "requeue": not (timer.exhausted & FATAL_STAGES),
+    }
 
-            except Exception as e:
-                print(f"[签到] 获取签到统计信息异常: {e}")
-                import traceback
-                traceback.print_exc()
 
-            # 保存最终截图
-            await page.screenshot(path='signin_result.png')
-            print("[调试] 已保存结果截图: signin_result.png")
+async def main():
+    """主函数"""
+    if RUN_MODE not in RUN_MODES:
+        print(f"[错误] 未知的运行模式: {RUN_MODE}，可选: {', '.join(RUN_MODES)}")
+        return
 
-        except Exception as e:
-            sign_msg = f"❌ 执行异常: {str(e)}"
-            print(f"[错误] {str(e)}")
-            import traceback
-            traceback.print_exc()
-            await page.screenshot(path='error_screenshot.png')
+    accounts = iter_accounts()
+    multi = bool(ACCOUNTS_FILE or ACCOUNTS)
+    if RUN_MODE == 'replay' and not (multi or USERNAME) and os.path.isdir(HAR_DIR):
+        # 未配置账号时使用已录制的账号；登录表单按方法和 URL 回放，不需要密码
+        accounts = ({"username": name[:-4], "password": ""}
+                    for name in sorted(os.listdir(HAR_DIR)) if name.endswith('.har'))
+        multi = True
+
+    # 先取出第一个账号，确认账号源不为空
+    first = next(accounts, None)
+    if first is None:
+        print("[错误] 未配置账号，请设置 ZHUIMI_ACCOUNTS_FILE、ZHUIMI_ACCOUNTS 或 ZHUIMI_USERNAME / ZHUIMI_PASSWORD")
+        return
+    accounts = itertools.chain([first], accounts)
+
+    state = load_account_state()
+    TIMEOUTS.load()
+    timings = {}  # 只在录制/回放时收集，正常运行不保留每个账号的结果
+    checkpoint = None
+    if RUN_MODE == 'live':
+        scheduler = CheckinScheduler()
+    else:
+        # 录制和回放都单并发、不分散、不重新排队（账号共用一个随机数序列），并使用相同的随机数种子，
+        # 使回放生成的滑动轨迹与录制时一致
+        random.seed(REPLAY_SEED)
+        scheduler = CheckinScheduler(concurrency=1, window=0, jitter=0, max_requeue=0)
+    if RUN_MODE == 'replay':
+        # 回放时另外不限速、不做阶段重试，保证每次运行可比
+        print(f"[回放] 从 {HAR_DIR} 回放，注入延迟 {REPLAY_LATENCY_MS:g}ms")
+        SITE_LIMITER.disable()
+        SOLVER_LIMITER.disable()
+    if RUN_MODE != 'replay':
+        checkpoint = Checkpoint()
+    if RUN_MODE == 'live':
+        # 从断点恢复：跳过今天已经成功的账号；录制时仍要访问所有账号才能生成 HAR，只写入不跳过
+        accounts = checkpoint.pending(accounts)
+    beijing_tz = pytz.timezone('Asia/Shanghai')
 
+    async with async_playwright() as p:
+        # 启动浏览器，所有账号共用一个浏览器进程，各自使用独立上下文
+        print("[浏览器] 正在启动...")
+        browser = await p.chromium.launch(
+            headless=HEADLESS,
+            args=browser_launch_args()
+        )
+        MEMORY_MONITOR.start(scheduler.concurrency)
+
+        async def worker(account, attempt):
+            print(f"[调度] {account['username']} 开始第 {attempt} 次签到")
+            return await run_account(browser, account, safe_name(account['username']) if multi else "")
+
+        async def on_final(result):
+            if RUN_MODE != 'live':
+                timings[result['username']] = result['timings']
+            print("\n" + "=" * 50)
+            print(result['message'])
+            print("=" * 50)
+            if RUN_MODE == 'replay':
+                return
+
+            state[result['username']] = {
+                "last_status": result['outcome'],
+                "remaining_days": result['remaining_days'],
+                "continuous_days": result['continuous_days'],
+                "last_run": datetime.now(beijing_tz).strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            checkpoint.record(result['username'], result['outcome'])
+            await run_stage('notify', lambda: send_telegram(result['message']), retry_if=lambda sent: not sent)
+
+        lag_monitor = LoopLagMonitor()
+        lag_monitor.start()
+        try:
+            await scheduler.run(accounts, state, worker, on_final)
         finally:
+            await lag_monitor.stop()
             await browser.close()
-
-    # 整合消息并发送
-    telegram_msg = f"""📅 *逐觅签到通知*
-
-👤 用户名：{USERNAME}
-🔗 专属链接：{api_link}
-📆 到期时间：{expire_time_str}
-📊 剩余天数：{remaining_days} 天
-
-{sign_msg}
-📈 今日签到次数：{today_sign_count}
-🔥 连续签到天数：{continuous_days}
-🕒 时间：{now}
-"""
-
-    print("\n" + "=" * 50)
-    print(telegram_msg)
-    print("=" * 50)
-    send_telegram(telegram_msg)
+            await close_http_client()
+            # 中途退出时也保存已完成账号的状态；回放的耗时不代表真实网络，不计入超时统计
+            if RUN_MODE != 'replay':
+                save_account_state(state)
+                TIMEOUTS.save()
+
+    if checkpoint and checkpoint.skipped:
+        print(f"[断点] 跳过今日已完成的账号 {checkpoint.skipped} 个")
+    scheduler.report()
+    TIMEOUTS.report()
+    print_retry_stats()
+    print(f"[事件循环] {lag_monitor.report()}")
+
+    if RUN_MODE != 'live':
+        # 保存本次各阶段耗时，回放时与上一次回放对比
+        timings_path = os.path.join(HAR_DIR, f"timings_{RUN_MODE}.json")
+        if RUN_MODE == 'replay' and os.path.exists(timings_path):
+            print_timing_diff(load_timings(timings_path), timings)
+            os.replace(timings_path, os.path.join(HAR_DIR, "timings_replay.prev.json"))
+        save_timings(timings_path, timings)
+        print(f"[耗时] 已保存各阶段耗时: {timings_path}")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    # 用法：python main.py [live|record|replay]
+    #       python main.py diff 之前.json 之后.json
+    if len(sys.argv) > 1 and sys.argv[1] == 'diff':
+        print_timing_diff(load_timings(sys.argv[2]), load_timings(sys.argv[3]))
+    else:
+        if len(sys.argv) > 1:
+            RUN_MODE = sys.argv[1]
+        asyncio.run(main())